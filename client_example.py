@@ -5,9 +5,12 @@ Este é um exemplo simples que pode ser usado como base para integração.
 """
 
 import requests
-import json
-import base64
-from typing import Optional, Dict, Any
+from requests.adapters import HTTPAdapter
+import httpx
+import asyncio
+import shutil
+import pybase64
+from typing import Optional, Dict, Any, List
 
 class YOLODamageDetectionClient:
     """Cliente para a API de detecção de danos veiculares."""
@@ -21,6 +24,22 @@ class YOLODamageDetectionClient:
         """
         self.base_url = base_url.rstrip('/')
         
+        # Sessão reutilizada entre chamadas (keep-alive + pool de conexões)
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=10, pool_maxsize=10)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+    
+    def close(self):
+        """Fecha a sessão HTTP e libera as conexões do pool."""
+        self._session.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        
     def health_check(self) -> Dict[str, Any]:
         """
         Verifica o status de saúde da API.
@@ -28,7 +47,7 @@ class YOLODamageDetectionClient:
         Returns:
             Dicionário com o status da API
         """
-        response = requests.get(f"{self.base_url}/health")
+        response = self._session.get(f"{self.base_url}/health")
         response.raise_for_status()
         return response.json()
     
@@ -39,7 +58,7 @@ class YOLODamageDetectionClient:
         Returns:
             Dicionário com informações do modelo
         """
-        response = requests.get(f"{self.base_url}/model/info")
+        response = self._session.get(f"{self.base_url}/model/info")
         response.raise_for_status()
         return response.json()
     
@@ -68,7 +87,8 @@ class YOLODamageDetectionClient:
         """
         with open(image_path, 'rb') as f:
             files = {'file': (image_path, f, 'image/jpeg')}
-            data = {
+            # A API recebe estas opções como query parameters (não campos do formulário)
+            params = {
                 'include_annotated_image': include_annotated_image,
                 'vehicle_plate': vehicle_plate,
                 'vehicle_model': vehicle_model,
@@ -77,9 +97,11 @@ class YOLODamageDetectionClient:
             }
             
             # Remover valores None
-            data = {k: v for k, v in data.items() if v is not None}
+            params = {k: v for k, v in params.items() if v is not None}
             
-            response = requests.post(f"{self.base_url}/detect", files=files, data=data)
+            response = self._session.post(
+                f"{self.base_url}/detect", files=files, params=params, stream=False
+            )
             response.raise_for_status()
             return response.json()
     
@@ -91,20 +113,100 @@ class YOLODamageDetectionClient:
             result: Resultado da detecção contendo a imagem anotada
             output_path: Caminho onde salvar a imagem
         """
-        if 'annotated_image' not in result:
+        if 'annotated_image_url' in result:
+            # Baixar o JPEG binário diretamente (sem base64)
+            response = self._session.get(f"{self.base_url}{result['annotated_image_url']}", stream=True)
+            response.raise_for_status()
+            with open(output_path, 'wb') as f:
+                shutil.copyfileobj(response.raw, f)
+        elif 'annotated_image' in result:
+            # Extrair dados da imagem base64
+            img_data = result['annotated_image']
+            if img_data.startswith('data:image'):
+                img_data = img_data.split(',')[1]
+            
+            # Decodificar e salvar
+            img_bytes = pybase64.b64decode(img_data)
+            with open(output_path, 'wb') as f:
+                f.write(img_bytes)
+        else:
             raise ValueError("Resultado não contém imagem anotada")
         
-        # Extrair dados da imagem base64
-        img_data = result['annotated_image']
-        if img_data.startswith('data:image'):
-            img_data = img_data.split(',')[1]
+        print(f"Imagem anotada salva em: {output_path}")
+
+class AsyncYOLODamageDetectionClient:
+    """Cliente assíncrono (HTTP/2) para inspecionar vários veículos em paralelo."""
+    
+    def __init__(self, base_url: str = "http://localhost:8000", max_concurrency: int = 16):
+        """
+        Inicializa o cliente.
         
-        # Decodificar e salvar
-        img_bytes = base64.b64decode(img_data)
-        with open(output_path, 'wb') as f:
-            f.write(img_bytes)
+        Args:
+            base_url: URL base da API
+            max_concurrency: Máximo de detecções simultâneas em detect_many
+        """
+        self.base_url = base_url.rstrip('/')
         
-        print(f"Imagem anotada salva em: {output_path}")
+        # HTTP/2 multiplexa as requisições sobre uma única conexão
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            http2=True,
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=32),
+            timeout=30.0
+        )
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+    
+    async def aclose(self):
+        """Fecha o cliente HTTP e libera as conexões do pool."""
+        await self._client.aclose()
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
+    
+    async def detect_damage(
+        self,
+        image_path: str,
+        include_annotated_image: bool = True,
+        vehicle_plate: Optional[str] = None,
+        vehicle_model: Optional[str] = None,
+        vehicle_year: Optional[int] = None,
+        vehicle_color: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Detecta danos em uma imagem de veículo (mesmos parâmetros do cliente síncrono)."""
+        with open(image_path, 'rb') as f:
+            content = f.read()
+        
+        files = {'file': (image_path, content, 'image/jpeg')}
+        # A API recebe estas opções como query parameters (não campos do formulário)
+        params = {
+            'include_annotated_image': include_annotated_image,
+            'vehicle_plate': vehicle_plate,
+            'vehicle_model': vehicle_model,
+            'vehicle_year': vehicle_year,
+            'vehicle_color': vehicle_color
+        }
+        
+        # Remover valores None
+        params = {k: v for k, v in params.items() if v is not None}
+        
+        async with self._semaphore:
+            response = await self._client.post("/detect", files=files, params=params)
+        response.raise_for_status()
+        return response.json()
+    
+    async def detect_many(self, image_paths: List[str], **kwargs) -> List[Dict[str, Any]]:
+        """
+        Detecta danos em várias imagens em paralelo, limitado por max_concurrency.
+        
+        Returns:
+            Lista de resultados na mesma ordem de image_paths
+        """
+        return await asyncio.gather(
+            *(self.detect_damage(path, **kwargs) for path in image_paths)
+        )
 
 def main():
     """Exemplo de uso do cliente."""
@@ -157,7 +259,7 @@ def main():
                 print()
         
         # Salvar imagem anotada
-        if 'annotated_image' in result:
+        if 'annotated_image_url' in result:
             client.save_annotated_image(result, "resultado_deteccao.jpg")
         
         print("✅ Detecção concluída com sucesso!")
@@ -176,6 +278,9 @@ def main():
         
     except Exception as e:
         print(f"❌ Erro inesperado: {e}")
+    
+    finally:
+        client.close()
 
 if __name__ == "__main__":
     main()
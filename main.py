@@ -1,18 +1,57 @@
 from fastapi import FastAPI, File, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 import numpy as np
+import cv2
 from PIL import Image
 import os
 import json
 from datetime import datetime
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import shutil
+import tempfile
 import io
 import base64
 from typing import Optional, List, Dict, Any
 import logging
 import threading
 import time
+import uuid
+import fcntl
+import hashlib
+import importlib
+import ast
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+
+# orjson é opcional: sem ele, respostas com o json da stdlib (mais lento; arrays
+# NumPy, como os bbox, convertidos em listas)
+try:
+    import orjson
+    from fastapi.responses import ORJSONResponse as FastJSONResponse
+    json_dumps = orjson.dumps
+except ImportError:
+    def json_dumps(content: Any) -> bytes:
+        """Serializa em JSON compacto (bytes) com a stdlib."""
+        return json.dumps(
+            content, ensure_ascii=False, separators=(",", ":"), default=lambda value: value.tolist()
+        ).encode("utf-8")
+    
+    class FastJSONResponse(JSONResponse):
+        """JSONResponse que também serializa arrays/escalares NumPy."""
+        
+        def render(self, content: Any) -> bytes:
+            return json_dumps(content)
+
+# pybase64 (SIMD) é opcional: sem o wheel, o base64 da stdlib gera o mesmo resultado
+try:
+    import pybase64
+except ImportError:
+    pybase64 = None
 
 # Configurar logging para Google Cloud
 logging.basicConfig(
@@ -20,6 +59,26 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
+if pybase64 is not None:
+    logger.info(f"🧮 pybase64: {pybase64.get_version()}")
+else:
+    logger.warning("⚠️ pybase64 não instalado, usando base64 da stdlib")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Inicia a fila de inferência e o carregamento do modelo; para o consumidor no shutdown."""
+    global _inference_queue, _model_loaded_event, _event_loop
+    _inference_queue = asyncio.Queue()
+    batch_worker = asyncio.create_task(inference_batch_worker())
+    
+    _model_loaded_event = asyncio.Event()
+    _event_loop = asyncio.get_running_loop()
+    # Thread daemon: um download em andamento não impede o shutdown do servidor
+    threading.Thread(target=download_and_load_model, name="model-loader", daemon=True).start()
+    
+    yield
+    
+    batch_worker.cancel()
 
 # Criar app FastAPI
 app = FastAPI(
@@ -27,9 +86,65 @@ app = FastAPI(
     description="API para detecção de danos em veículos usando YOLOv8",
     version="2.1.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=FastJSONResponse,
+    lifespan=lifespan
 )
 
+# Tamanho máximo aceito para uploads em /detect
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", 10 * 1024 * 1024))
+# O corpo multipart inclui boundary e cabeçalhos da parte além do arquivo: a checagem
+# do corpo tem essa folga, e o limite exato do arquivo é conferido em /detect (file.size)
+MAX_REQUEST_BYTES = MAX_UPLOAD_BYTES + 64 * 1024
+
+class UploadSizeLimitMiddleware:
+    """Rejeita com 413 requisições cujo Content-Length excede o limite,
+    antes de o corpo ser lido e armazenado. Sem Content-Length (chunked),
+    interrompe a leitura assim que o corpo recebido passa do limite."""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["method"] == "POST":
+            for name, value in scope["headers"]:
+                if name == b"content-length":
+                    if value.isdigit() and int(value) > MAX_REQUEST_BYTES:
+                        response = FastJSONResponse(
+                            status_code=413,
+                            content={"detail": upload_too_large_detail()}
+                        )
+                        await response(scope, receive, send)
+                        return
+                    break
+            else:
+                receive = self.limit_body(receive)
+        await self.app(scope, receive, send)
+    
+    @staticmethod
+    def limit_body(receive):
+        """Envolve o receive do ASGI contando os bytes do corpo."""
+        received = 0
+        
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > MAX_REQUEST_BYTES:
+                    # Levantada durante o parse do formulário: o FastAPI a repassa como 413
+                    raise HTTPException(status_code=413, detail=upload_too_large_detail())
+            return message
+        
+        return limited_receive
+
+def upload_too_large_detail() -> str:
+    """Mensagem das respostas 413 de upload acima do limite."""
+    return f"Arquivo excede o limite de {MAX_UPLOAD_BYTES // (1024 * 1024)}MB"
+
+# Adicionado antes do CORS para que a resposta 413 também receba os headers CORS
+app.add_middleware(UploadSizeLimitMiddleware)
+
 # CORS configurado para produção
 app.add_middleware(
     CORSMiddleware,
@@ -39,6 +154,33 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+class HealthCheckMiddleware:
+    """Responde GET /health direto no ASGI, sem passar pelo CORS, pelo roteamento
+    e pela validação do FastAPI (o load balancer consulta /health a cada poucos segundos)."""
+    
+    HEADERS = [
+        (b"content-type", b"application/json"),
+        (b"access-control-allow-origin", b"*"),
+    ]
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == "/health" and scope["method"] == "GET":
+            body = json_dumps(health())
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": self.HEADERS + [(b"content-length", str(len(body)).encode())],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+        await self.app(scope, receive, send)
+
+# Adicionado por último: é o primeiro a receber a requisição
+app.add_middleware(HealthCheckMiddleware)
+
 # Configuração dos danos
 DAMAGE_CONFIG = {
     'severity_map': {
@@ -67,57 +209,736 @@ DAMAGE_CONFIG = {
     }
 }
 
+# Níveis de severidade (em ordem) e urgência de reparo indexada por
+# 2 * (há dano Severo) + (há dano Moderado)
+SEVERITY_LEVELS = ('Leve', 'Moderado', 'Severo')
+SEVERITY_CODES = {severity: code for code, severity in enumerate(SEVERITY_LEVELS)}
+REPAIR_URGENCY = ('Baixa', 'Média', 'Alta', 'Alta')
+
+# Trechos constantes da resposta de /detect (copiados e completados a cada requisição)
+NOT_INFORMED = "Não informado"
+_INSPECTION_TEMPLATE = {
+    "inspector": "Sistema IA YOLO API v2.1 - TESTADO",
+    "version": "2.1.0",
+}
+# Resumo de uma inspeção sem danos (compartilhado entre respostas, nunca modificado)
+_NO_DAMAGE_SUMMARY = {
+    "total_damages": 0,
+    "severity_count": dict.fromkeys(SEVERITY_LEVELS, 0),
+    "damage_types": [],
+    "repair_urgency": REPAIR_URGENCY[0],
+}
+_EMPTY_VEHICLE = {
+    "plate": NOT_INFORMED,
+    "model": NOT_INFORMED,
+    "year": NOT_INFORMED,
+    "color": NOT_INFORMED,
+}
+
+# Sessão HTTP para download do modelo (pool de conexões + retries)
+# Partes baixadas em paralelo via HTTP Range (uma conexão por parte)
+MODEL_DOWNLOAD_PARTS = 4
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    pool_maxsize=MODEL_DOWNLOAD_PARTS,
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=(500, 502, 503, 504))
+))
+
+# Imagens anotadas servidas por /detect/{id}/image. Ficam em /tmp (e não na
+# memória do processo) para que qualquer worker do gunicorn consiga servi-las.
+ANNOTATED_IMAGE_DIR = os.environ.get("ANNOTATED_IMAGE_DIR", "/tmp/annotated_images")
+ANNOTATED_IMAGE_TTL_SECONDS = 300
+ANNOTATED_IMAGE_MAX_ENTRIES = 128
+# A limpeza (scandir + stat por arquivo) roda no máximo uma vez por intervalo, não a cada /detect
+ANNOTATED_IMAGE_PRUNE_INTERVAL_SECONDS = 30
+_last_annotated_prune = 0.0
+# Qualidade do JPEG anotado (o OpenCV já usa subamostragem de croma 4:2:0)
+ANNOTATED_JPEG_QUALITY = int(os.environ.get("ANNOTATED_JPEG_QUALITY", 80))
+
+# Cache LRU de resultados por hash (blake2b) do upload. Guarda só as detecções e o
+# tamanho da imagem; a imagem anotada é redesenhada a partir do upload quando pedida
+DETECTION_CACHE_SIZE = int(os.environ.get("DETECTION_CACHE_SIZE", 256))
+_detection_cache: "OrderedDict[bytes, tuple]" = OrderedDict()
+
+# Micro-batching da inferência: requisições que chegam juntas viram um único forward
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", 8))
+MAX_BATCH_WAIT_SECONDS = float(os.environ.get("MAX_BATCH_WAIT_SECONDS", 0.02))
+_inference_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="yolo-inference")
+_inference_queue: Optional[asyncio.Queue] = None
+
+# Diretório dos pesos e dos modelos exportados: /tmp no Cloud Run, ou um diretório
+# da imagem quando o modelo é baixado/exportado no docker build
+MODEL_DIR = os.environ.get("MODEL_DIR", "/tmp")
+# Backend de inferência: "pytorch" (pesos .pt), "onnx", "tensorrt" ou "openvino" (exportados na inicialização)
+MODEL_BACKEND = os.environ.get("MODEL_BACKEND", "pytorch").lower()
+# Precisão do modelo exportado: "fp32", "fp16" (exportação em GPU) ou "int8" (quantização do ONNX)
+MODEL_PRECISION = os.environ.get("MODEL_PRECISION", "fp32").lower()
+# Imagens de exemplo para a quantização INT8 estática (sem elas, a quantização é dinâmica)
+CALIBRATION_DIR = os.environ.get("CALIBRATION_DIR")
+# Cache dos engines TensorRT compilados no GCS ("gs://bucket/prefixo"), compartilhado entre instâncias
+ENGINE_CACHE_URI = os.environ.get("ENGINE_CACHE_URI")
+
+# Metadados por id de classe do modelo: (nome, exibição, severidade, localização)
+_CLASS_META: List[tuple] = []
+# Código de severidade por id de classe (índice em SEVERITY_LEVELS; Indefinido = len)
+_CLASS_SEVERITY_CODES = np.zeros(0, dtype=np.int8)
+
+# Threads intra-op do PyTorch por worker (padrão: vCPUs divididas entre os workers)
+TORCH_NUM_THREADS = int(os.environ.get(
+    "TORCH_NUM_THREADS",
+    max(1, (os.cpu_count() or 1) // int(os.environ.get("WEB_CONCURRENCY", 1)))
+))
+# Shape (altura, largura) de entrada fixo do modelo PyTorch e buffers de entrada
+# reutilizados entre lotes (usados só pela thread de inferência)
+INFERENCE_IMGSZ = (640, 640)
+_torch_canvas = np.empty((*INFERENCE_IMGSZ, 3), dtype=np.uint8)
+_torch_input = None
+# torch.compile opcional (PyTorch 2.x): compila na inicialização, após o aquecimento
+TORCH_COMPILE = os.environ.get("TORCH_COMPILE", "0") == "1"
+# Modo do torch.compile ("max-autotune" testa variantes de kernels e captura CUDA graphs)
+TORCH_COMPILE_MODE = os.environ.get("TORCH_COMPILE_MODE", "default")
+# Kernels compilados (e resultados do autotune) persistidos junto do modelo: próximos
+# starts, ou a imagem gerada no docker build, reaproveitam a compilação
+os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", os.path.join(MODEL_DIR, "torchinductor"))
+os.environ.setdefault("TORCHINDUCTOR_FX_GRAPH_CACHE", "1")
+# Inferência em FP16 (definido na carga do modelo quando há GPU)
+_use_half = False
+
+# Garante que o modelo seja baixado/carregado uma única vez por processo
+_model_lock = threading.Lock()
+
 # Variáveis globais
 model = None
 model_ready = False
 model_error = None
-startup_time = datetime.now()
+
+# Sinaliza o fim do carregamento (sucesso ou erro) para requisições em espera
+MODEL_WAIT_TIMEOUT_SECONDS = float(os.environ.get("MODEL_WAIT_TIMEOUT_SECONDS", 60))
+_model_loaded_event: Optional[asyncio.Event] = None
+_event_loop: Optional[asyncio.AbstractEventLoop] = None
+# Relógio monotônico: uptime sem saltos de NTP e sem montar objetos datetime
+startup_time = time.monotonic()
+
+# Classe YOLO, importada pela thread de carregamento (nunca em uma requisição)
+_YOLO = None
+# Resultado de probe_dependencies (as versões não mudam durante a vida do processo)
+_dependency_status: Optional[tuple] = None
+
+# Parte "YYYY-MM-DDTHH:MM:SS" do último timestamp, reformatada só quando o segundo muda
+_timestamp_cache = (0, "")
+
+def export_model(model_path: str) -> str:
+    """Exporta o modelo para o backend configurado e retorna o caminho a carregar."""
+    if MODEL_BACKEND not in ("onnx", "tensorrt", "openvino"):
+        return model_path
+    if MODEL_BACKEND == "openvino":
+        return export_openvino(model_path)
+    
+    onnx_path = os.path.splitext(model_path)[0] + ".onnx"
+    if not os.path.exists(onnx_path):
+        logger.info("📦 Exportando modelo para ONNX...")
+        # dynamic=True mantém o eixo de batch livre para o micro-batcher
+        exported = _YOLO(model_path).export(format="onnx", imgsz=640, dynamic=True, simplify=True)
+        os.replace(exported, onnx_path)
+    else:
+        logger.info("✅ Modelo ONNX já existe no cache")
+    
+    if MODEL_BACKEND == "tensorrt":
+        return build_tensorrt_engine(onnx_path)
+    
+    if MODEL_PRECISION == "fp16":
+        return export_fp16_onnx(model_path)
+    
+    if MODEL_PRECISION != "int8":
+        return onnx_path
+    
+    # Com imagens de calibração, quantização estática (pesos e ativações em INT8)
+    suffix = ".int8-static.onnx" if CALIBRATION_DIR else ".int8.onnx"
+    int8_path = os.path.splitext(model_path)[0] + suffix
+    if not os.path.exists(int8_path):
+        import onnx
+        from onnxruntime.quantization import quantize_dynamic, quantize_static, QuantFormat, QuantType
+        if CALIBRATION_DIR:
+            logger.info(f"🧮 Quantizando modelo ONNX para INT8 (estática, calibração em {CALIBRATION_DIR})...")
+            input_name = onnx.load(onnx_path).graph.input[0].name
+            quantize_static(
+                onnx_path, int8_path + ".part", ImageCalibrationReader(CALIBRATION_DIR, input_name),
+                quant_format=QuantFormat.QDQ,
+                activation_type=QuantType.QUInt8,
+                weight_type=QuantType.QInt8,
+                per_channel=True
+            )
+        else:
+            logger.info("🧮 Quantizando modelo ONNX para INT8...")
+            quantize_dynamic(onnx_path, int8_path + ".part", weight_type=QuantType.QUInt8)
+        # Preservar metadados (nomes das classes, stride, imgsz) usados pelo Ultralytics
+        source = onnx.load(onnx_path)
+        quantized = onnx.load(int8_path + ".part")
+        del quantized.metadata_props[:]
+        quantized.metadata_props.extend(source.metadata_props)
+        onnx.save(quantized, int8_path + ".part")
+        os.replace(int8_path + ".part", int8_path)
+    return int8_path
+
+def export_openvino(model_path: str) -> str:
+    """Exporta o modelo para OpenVINO IR (CPUs Intel; pesos FP16 com MODEL_PRECISION=fp16)."""
+    half = MODEL_PRECISION == "fp16"
+    ov_dir = os.path.splitext(model_path)[0] + ("_fp16" if half else "") + "_openvino_model"
+    if not os.path.isdir(ov_dir):
+        logger.info(f"📦 Exportando modelo para OpenVINO{' FP16' if half else ''}...")
+        # dynamic=True mantém o eixo de batch livre para o micro-batcher
+        export_isolated(model_path, ov_dir, format="openvino", imgsz=640, dynamic=True, half=half)
+    else:
+        logger.info("✅ Modelo OpenVINO já existe no cache")
+    return ov_dir
+
+class ImageCalibrationReader:
+    """Fornece ao quantize_static as imagens de calibração já pré-processadas."""
+    
+    def __init__(self, image_dir: str, input_name: str, imgsz: tuple = (640, 640), limit: int = 100):
+        names = sorted(
+            name for name in os.listdir(image_dir)
+            if name.lower().endswith(('.jpg', '.jpeg', '.png', '.webp'))
+        )[:limit]
+        self.paths = [os.path.join(image_dir, name) for name in names]
+        self.input_name = input_name
+        self.imgsz = imgsz
+        self.rewind()
+    
+    def get_next(self) -> Optional[Dict[str, np.ndarray]]:
+        for path in self._pending:
+            image = cv2.imread(path, cv2.IMREAD_COLOR)
+            if image is None:
+                continue
+            padded, _, _ = letterbox(image, self.imgsz)
+            return {self.input_name: cv2.dnn.blobFromImage(padded, scalefactor=1 / 255.0, swapRB=True)}
+        return None
+    
+    def rewind(self):
+        self._pending = iter(self.paths)
+
+def export_fp16_onnx(model_path: str) -> str:
+    """Exporta o modelo ONNX em FP16 (requer GPU; sem GPU usa o ONNX FP32)."""
+    import torch
+    onnx_path = os.path.splitext(model_path)[0] + ".onnx"
+    if not torch.cuda.is_available():
+        logger.warning("⚠️ MODEL_PRECISION=fp16 requer GPU, usando ONNX FP32")
+        return onnx_path
+    
+    fp16_path = os.path.splitext(model_path)[0] + ".fp16.onnx"
+    if not os.path.exists(fp16_path):
+        logger.info("📦 Exportando modelo para ONNX FP16...")
+        export_isolated(model_path, fp16_path, format="onnx", imgsz=640, dynamic=True, simplify=True, half=True, device=0)
+    return fp16_path
+
+def export_isolated(model_path: str, dest: str, **export_args):
+    """Exporta a partir de uma cópia do .pt num diretório temporário e move o resultado para dest.
+    
+    O Ultralytics grava a saída ao lado do .pt com nome fixo (car_damage_best.onnx,
+    car_damage_best_openvino_model/): exportando no lugar, uma variante (FP16)
+    sobrescreveria a outra já cacheada (FP32).
+    """
+    tmp_dir = tempfile.mkdtemp(prefix=".export-", dir=os.path.dirname(model_path))
+    try:
+        tmp_model = os.path.join(tmp_dir, os.path.basename(model_path))
+        shutil.copyfile(model_path, tmp_model)
+        exported = _YOLO(tmp_model).export(**export_args)
+        os.replace(str(exported).rstrip(os.sep), dest)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+def download_file(url: str, path: str) -> int:
+    """Baixa url em path, em partes paralelas (HTTP Range) quando o servidor permite."""
+    try:
+        head = _SESSION.head(url, allow_redirects=True, timeout=10)
+        head.raise_for_status()
+        total_size = int(head.headers.get('content-length', 0))
+    except (requests.RequestException, ValueError) as e:
+        # HEAD recusado/mal tratado (403/405, URL assinada só para GET...): GET simples
+        logger.info(f"ℹ️ HEAD indisponível ({e}), baixando em uma única conexão")
+        return download_stream(url, path)
+    if total_size > 0:
+        logger.info(f"📥 Tamanho do download: {total_size / 1024 / 1024:.1f}MB")
+    if head.headers.get('accept-ranges') != 'bytes' or total_size < MODEL_DOWNLOAD_PARTS * 1024 * 1024:
+        return download_stream(url, path)
+    
+    try:
+        # URL final após os redirects (o release do GitHub aponta para uma URL assinada)
+        return download_ranges(head.url, path, total_size)
+    except (requests.RequestException, RuntimeError) as e:
+        logger.warning(f"⚠️ Download em partes falhou ({e}), baixando em uma única conexão")
+        return download_stream(url, path)
+
+def download_ranges(url: str, path: str, total_size: int) -> int:
+    """Baixa url em MODEL_DOWNLOAD_PARTS intervalos paralelos gravados direto no arquivo."""
+    part_size = -(-total_size // MODEL_DOWNLOAD_PARTS)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        os.ftruncate(fd, total_size)
+        with ThreadPoolExecutor(max_workers=MODEL_DOWNLOAD_PARTS, thread_name_prefix="yolo-download") as pool:
+            ranges = [(lo, min(lo + part_size, total_size) - 1) for lo in range(0, total_size, part_size)]
+            for future in [pool.submit(download_range, url, fd, lo, hi) for lo, hi in ranges]:
+                future.result()
+    finally:
+        os.close(fd)
+    return total_size
+
+def download_range(url: str, fd: int, lo: int, hi: int):
+    """Baixa os bytes [lo, hi] de url e os grava na mesma posição do arquivo."""
+    response = _SESSION.get(url, headers={"Range": f"bytes={lo}-{hi}"}, stream=True, timeout=(10, 300))
+    response.raise_for_status()
+    if response.status_code != 206:
+        raise RuntimeError(f"Servidor ignorou o Range bytes={lo}-{hi}")
+    offset = lo
+    for chunk in response.iter_content(chunk_size=1024 * 1024):
+        os.pwrite(fd, chunk, offset)
+        offset += len(chunk)
+    if offset != hi + 1:
+        raise RuntimeError(f"Download incompleto do intervalo bytes={lo}-{hi}")
+
+def download_stream(url: str, path: str) -> int:
+    """Baixa url em path numa única conexão."""
+    response = _SESSION.get(url, stream=True, timeout=(10, 300))
+    response.raise_for_status()
+    # Cópia em blocos de 1MB feita em C (sem loop Python por chunk)
+    response.raw.decode_content = True
+    with open(path, 'wb') as f:
+        shutil.copyfileobj(response.raw, f, length=1024 * 1024)
+        return f.tell()
+
+def probe_dependencies() -> tuple:
+    """Verifica as dependências uma única vez por processo: (resultados, todas OK)."""
+    global _dependency_status
+    if _dependency_status is None:
+        results = {}
+        for name, module_name, has_version in (
+            ("numpy", "numpy", True),
+            ("torch", "torch", True),
+            ("opencv", "cv2", True),
+            ("ultralytics", "ultralytics", False),
+            ("pillow", "PIL.Image", False),
+        ):
+            try:
+                module = importlib.import_module(module_name)
+                if has_version:
+                    results[name] = {"status": "OK", "version": module.__version__}
+                else:
+                    results[name] = {"status": "OK", "available": True}
+            except Exception as e:
+                results[name] = {"status": "ERROR", "error": str(e)}
+        _dependency_status = (results, all(dep["status"] == "OK" for dep in results.values()))
+    return _dependency_status
+
+def import_inference_stack():
+    """Importa ultralytics/torch (vários segundos) e configura o PyTorch."""
+    global _YOLO
+    from ultralytics import YOLO
+    _YOLO = YOLO
+    configure_torch()
+
+def select_tensorrt_precision() -> str:
+    """INT8 só quando pedido, com calibração e Tensor Cores INT8 (compute capability >= 7.5); senão FP16."""
+    if MODEL_PRECISION != "int8":
+        return "fp16"
+    import torch
+    capability = torch.cuda.get_device_capability()
+    if capability < (7, 5):
+        logger.warning(f"⚠️ GPU sem Tensor Cores INT8 (compute capability {capability[0]}.{capability[1]}), usando FP16")
+        return "fp16"
+    if not CALIBRATION_DIR:
+        logger.warning("⚠️ INT8 no TensorRT requer CALIBRATION_DIR, usando FP16")
+        return "fp16"
+    return "int8"
+
+def build_tensorrt_engine(onnx_path: str) -> str:
+    """Compila o ONNX em um engine TensorRT (INT8 com MODEL_PRECISION=int8, senão FP16)."""
+    precision = select_tensorrt_precision()
+    engine_path = os.path.splitext(onnx_path)[0] + f".{precision}.engine"
+    if os.path.exists(engine_path):
+        logger.info("✅ Engine TensorRT já existe no cache")
+        return engine_path
+    
+    import onnx
+    import tensorrt as trt
+    engine_blob = tensorrt_engine_blob(engine_path, trt.__version__)
+    if engine_blob is not None and download_tensorrt_engine(engine_blob, engine_path):
+        return engine_path
+    logger.info(f"🏗️ Compilando engine TensorRT {precision.upper()}...")
+    trt_logger = trt.Logger(trt.Logger.WARNING)
+    builder = trt.Builder(trt_logger)
+    network = builder.create_network(1 << int(trt.NetworkDefinitionCreationFlag.EXPLICIT_BATCH))
+    parser = trt.OnnxParser(network, trt_logger)
+    if not parser.parse_from_file(onnx_path):
+        errors = "; ".join(str(parser.get_error(i)) for i in range(parser.num_errors))
+        raise RuntimeError(f"Falha ao ler o ONNX no TensorRT: {errors}")
+    
+    config = builder.create_builder_config()
+    config.set_memory_pool_limit(trt.MemoryPoolType.WORKSPACE, 4 << 30)
+    # Entrada sempre 640x640; o lote varia de 1 até MAX_BATCH_SIZE (micro-batcher)
+    input_name = network.get_input(0).name
+    profile = builder.create_optimization_profile()
+    profile.set_shape(
+        input_name,
+        (1, 3, *INFERENCE_IMGSZ),
+        (max(1, MAX_BATCH_SIZE // 2), 3, *INFERENCE_IMGSZ),
+        (MAX_BATCH_SIZE, 3, *INFERENCE_IMGSZ)
+    )
+    config.add_optimization_profile(profile)
+    config.set_flag(trt.BuilderFlag.FP16)  # Camadas sem kernel INT8 caem para FP16, não FP32
+    if precision == "int8":
+        config.set_flag(trt.BuilderFlag.INT8)
+        # Mantido em uma variável local: o binding não segura a referência durante o build
+        calibrator = make_int8_calibrator(trt, input_name, onnx_path + ".calib")
+        config.int8_calibrator = calibrator
+        config.set_calibration_profile(profile)
+    
+    serialized = builder.build_serialized_network(network, config)
+    if serialized is None:
+        raise RuntimeError("Falha ao compilar o engine TensorRT")
+    
+    # Mesmo formato do export do Ultralytics: tamanho + metadados JSON + engine,
+    # para que o YOLO carregue o .engine com nomes das classes, stride e imgsz
+    metadata = json.dumps({prop.key: prop.value for prop in onnx.load(onnx_path).metadata_props}).encode()
+    part_path = f"{engine_path}.{os.getpid()}.part"
+    with open(part_path, 'wb') as f:
+        f.write(len(metadata).to_bytes(4, byteorder='little', signed=True))
+        f.write(metadata)
+        f.write(serialized)
+    os.replace(part_path, engine_path)
+    if engine_blob is not None:
+        upload_tensorrt_engine(engine_blob, engine_path)
+    return engine_path
+
+def tensorrt_engine_blob(engine_path: str, trt_version: str):
+    """Objeto do engine no GCS (ENGINE_CACHE_URI), ou None sem cache configurado.
+    
+    O engine só é válido para a mesma arquitetura de GPU, versão do TensorRT e
+    perfil de lote, por isso esses valores fazem parte do nome do objeto.
+    """
+    if not ENGINE_CACHE_URI:
+        return None
+    import torch
+    bucket_name, _, prefix = ENGINE_CACHE_URI.removeprefix("gs://").partition("/")
+    major, minor = torch.cuda.get_device_capability()
+    stem, _ = os.path.splitext(os.path.basename(engine_path))
+    name = f"{stem}.sm{major}{minor}.trt{trt_version}.b{MAX_BATCH_SIZE}.engine"
+    try:
+        from google.cloud import storage
+        return storage.Client().bucket(bucket_name).blob(f"{prefix.rstrip('/')}/{name}".lstrip("/"))
+    except Exception as e:
+        # Pacote ausente, sem credenciais ou URI inválida: segue compilando localmente
+        logger.warning(f"⚠️ Cache de engines no GCS indisponível ({ENGINE_CACHE_URI}): {e}")
+        return None
+
+def download_tensorrt_engine(blob, engine_path: str) -> bool:
+    """Baixa um engine já compilado do GCS; False se ainda não existir (ou falhar)."""
+    part_path = f"{engine_path}.{os.getpid()}.part"
+    try:
+        blob.download_to_filename(part_path)
+    except Exception as e:
+        logger.info(f"ℹ️ Engine TensorRT não encontrado em gs://{blob.bucket.name}/{blob.name} ({e})")
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        return False
+    os.replace(part_path, engine_path)
+    logger.info(f"✅ Engine TensorRT baixado de gs://{blob.bucket.name}/{blob.name}")
+    return True
+
+def upload_tensorrt_engine(blob, engine_path: str):
+    """Publica o engine compilado no GCS para os próximos cold starts."""
+    try:
+        blob.upload_from_filename(engine_path)
+        logger.info(f"☁️ Engine TensorRT salvo em gs://{blob.bucket.name}/{blob.name}")
+    except Exception as e:
+        logger.warning(f"⚠️ Falha ao salvar o engine TensorRT no GCS: {e}")
+
+def make_int8_calibrator(trt, input_name: str, cache_path: str):
+    """Calibrador de entropia do TensorRT alimentado pelas imagens de CALIBRATION_DIR."""
+    import torch
+    
+    class EntropyCalibrator(trt.IInt8EntropyCalibrator2):
+        def __init__(self):
+            super().__init__()
+            self.reader = ImageCalibrationReader(CALIBRATION_DIR, input_name, INFERENCE_IMGSZ)
+            self.device_input = torch.empty((1, 3, *INFERENCE_IMGSZ), dtype=torch.float32, device="cuda")
+        
+        def get_batch_size(self):
+            return 1
+        
+        def get_batch(self, names):
+            inputs = self.reader.get_next()
+            if inputs is None:
+                return None
+            self.device_input.copy_(torch.from_numpy(inputs[input_name]))
+            return [int(self.device_input.data_ptr())]
+        
+        def read_calibration_cache(self):
+            if os.path.exists(cache_path):
+                with open(cache_path, 'rb') as f:
+                    return f.read()
+            return None
+        
+        def write_calibration_cache(self, cache):
+            with open(cache_path, 'wb') as f:
+                f.write(cache)
+    
+    return EntropyCalibrator()
+
+def letterbox(image: np.ndarray, imgsz: tuple, out: Optional[np.ndarray] = None) -> tuple:
+    """Redimensiona mantendo a proporção e completa com cinza até imgsz (altura, largura).
+    
+    Com out (uint8, imgsz + (3,)), escreve no buffer informado em vez de alocar um novo.
+    """
+    height, width = image.shape[:2]
+    target_height, target_width = imgsz
+    gain = min(target_height / height, target_width / width)
+    new_width, new_height = round(width * gain), round(height * gain)
+    pad_x = (target_width - new_width) / 2
+    pad_y = (target_height - new_height) / 2
+    top, bottom = round(pad_y - 0.1), round(pad_y + 0.1)
+    left, right = round(pad_x - 0.1), round(pad_x + 0.1)
+    
+    if out is None:
+        if (new_width, new_height) != (width, height):
+            image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+        image = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+        return image, gain, (left, top)
+    
+    # Só as bordas são preenchidas; a área da imagem é sobrescrita pelo resize
+    out[:top] = 114
+    out[top + new_height:] = 114
+    out[:, :left] = 114
+    out[:, left + new_width:] = 114
+    region = out[top:top + new_height, left:left + new_width]
+    if (new_width, new_height) != (width, height):
+        cv2.resize(image, (new_width, new_height), dst=region, interpolation=cv2.INTER_LINEAR)
+    else:
+        np.copyto(region, image)
+    return out, gain, (left, top)
+
+def fill_input_blob(images: List[np.ndarray], canvas: np.ndarray, blob: np.ndarray) -> List[tuple]:
+    """Escreve cada imagem BGR em blob[i] (NCHW, RGB, 0-1) via letterbox em canvas; retorna (ganho, padding)."""
+    transforms = []
+    for i, image in enumerate(images):
+        _, gain, pad = letterbox(image, canvas.shape[:2], out=canvas)
+        # BGR→RGB, HWC→CHW e normalização em uma única passada, direto no blob
+        np.multiply(canvas.transpose(2, 0, 1)[::-1], 1 / 255.0, out=blob[i], casting="unsafe")
+        transforms.append((gain, pad))
+    return transforms
+
+def scale_boxes(detections: np.ndarray, gain: float, pad: tuple, shape: tuple) -> np.ndarray:
+    """Leva as caixas (N, 6) do espaço do letterbox de volta à imagem original (in-place)."""
+    detections[:, [0, 2]] = ((detections[:, [0, 2]] - pad[0]) / gain).clip(0, shape[1])
+    detections[:, [1, 3]] = ((detections[:, [1, 3]] - pad[1]) / gain).clip(0, shape[0])
+    return detections
+
+class OnnxYOLODetector:
+    """Executa o modelo ONNX direto no ONNX Runtime, sem o wrapper do Ultralytics.
+    
+    Reutiliza os buffers de entrada entre chamadas: deve ser usado por uma thread só
+    (a de inferência).
+    """
+    
+    def __init__(self, model_path: str, conf_threshold: float = 0.25, iou_threshold: float = 0.7, max_det: int = 300):
+        import onnxruntime as ort
+        
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = TORCH_NUM_THREADS
+        available = ort.get_available_providers()
+        providers = [
+            provider for provider in ("CUDAExecutionProvider", "OpenVINOExecutionProvider", "CPUExecutionProvider")
+            if provider in available
+        ]
+        self.session = ort.InferenceSession(model_path, options, providers=providers)
+        
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.input_dtype = np.float16 if model_input.type == "tensor(float16)" else np.float32
+        
+        # Metadados gravados pelo export do Ultralytics
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.names = ast.literal_eval(metadata["names"])
+        self.imgsz = ast.literal_eval(metadata.get("imgsz", "[640, 640]"))
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+        self.max_det = max_det
+        self._canvas = np.empty((*self.imgsz, 3), dtype=np.uint8)
+        self._blob: Optional[np.ndarray] = None
+        logger.info(f"🧠 ONNX Runtime: {self.session.get_providers()[0]}")
+    
+    def postprocess(self, prediction: np.ndarray, gain: float, pad: tuple, shape: tuple) -> np.ndarray:
+        """Filtra por confiança, aplica NMS por classe e volta para as coordenadas da imagem."""
+        prediction = prediction.T  # (âncoras, 4 + classes)
+        scores = prediction[:, 4:]
+        class_ids = scores.argmax(axis=1)
+        confidences = scores[np.arange(len(scores)), class_ids]
+        keep = confidences > self.conf_threshold
+        if not keep.any():
+            return np.zeros((0, 6), dtype=np.float32)
+        
+        boxes_xywh = prediction[keep, :4]
+        confidences = confidences[keep]
+        class_ids = class_ids[keep]
+        boxes = np.empty_like(boxes_xywh)
+        boxes[:, :2] = boxes_xywh[:, :2] - boxes_xywh[:, 2:] / 2
+        boxes[:, 2:] = boxes_xywh[:, 2:]
+        indices = cv2.dnn.NMSBoxesBatched(
+            boxes.tolist(), confidences.tolist(), class_ids.tolist(), self.conf_threshold, self.iou_threshold
+        )
+        indices = np.asarray(indices, dtype=np.intp).reshape(-1)[:self.max_det]
+        
+        detections = np.empty((len(indices), 6), dtype=np.float32)
+        detections[:, :2] = boxes[indices, :2]
+        detections[:, 2:4] = boxes[indices, :2] + boxes[indices, 2:]
+        detections[:, 4] = confidences[indices]
+        detections[:, 5] = class_ids[indices]
+        return scale_boxes(detections, gain, pad, shape)
+    
+    def preprocess(self, images: List[np.ndarray]) -> tuple:
+        """Monta o blob NCHW do lote nos buffers reutilizados; retorna também (ganho, padding) por imagem."""
+        if self._blob is None or len(self._blob) < len(images):
+            self._blob = np.empty((len(images), 3, *self.imgsz), dtype=self.input_dtype)
+        blob = self._blob[:len(images)]
+        return blob, fill_input_blob(images, self._canvas, blob)
+    
+    def __call__(self, images: List[np.ndarray]) -> List[np.ndarray]:
+        """Detecta em um lote de imagens BGR; retorna (N, 6) [x1, y1, x2, y2, conf, classe] por imagem."""
+        blob, transforms = self.preprocess(images)
+        predictions = self.session.run(None, {self.input_name: blob})[0].astype(np.float32, copy=False)
+        return [
+            self.postprocess(prediction, gain, pad, image.shape[:2])
+            for prediction, (gain, pad), image in zip(predictions, transforms, images)
+        ]
+
+def configure_torch():
+    """Ajusta o PyTorch para inferência: threads, cuDNN e precisão."""
+    global _use_half
+    import torch
+    
+    # Com GPU as threads intra-op da CPU ficam ociosas (pré-processamento é NumPy e o
+    # forward/NMS rodam no device): uma basta, salvo TORCH_NUM_THREADS explícito
+    num_threads = TORCH_NUM_THREADS
+    if torch.cuda.is_available() and "TORCH_NUM_THREADS" not in os.environ:
+        num_threads = 1
+    torch.set_num_threads(num_threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # Só pode ser definido antes do primeiro trabalho paralelo
+    torch.backends.cudnn.benchmark = True
+    _use_half = torch.cuda.is_available() and MODEL_BACKEND == "pytorch"
+    logger.info(f"⚙️ PyTorch: {num_threads} threads, FP16={'sim' if _use_half else 'não'}")
+
+def compile_model():
+    """Compila com torch.compile a rede usada pelo predictor do Ultralytics."""
+    import torch
+    if not hasattr(torch, "compile"):
+        logger.warning("⚠️ TORCH_COMPILE requer PyTorch 2.x, seguindo sem compilação")
+        return
+    logger.info(f"🛠️ Compilando modelo com torch.compile (mode={TORCH_COMPILE_MODE})...")
+    # O predictor só existe após a primeira predição e envolve o nn.Module em um AutoBackend
+    backend = model.predictor.model
+    # dynamic=True: o micro-batcher varia o tamanho do lote (a resolução é sempre 640x640)
+    backend.model = torch.compile(backend.model, mode=TORCH_COMPILE_MODE, dynamic=True)
+
+def build_class_meta(names: Dict[int, str]) -> List[tuple]:
+    """Pré-calcula os metadados de cada classe, indexados pelo id do YOLO."""
+    class_meta = []
+    for class_id in range(len(names)):
+        name = names[class_id]
+        class_meta.append((
+            name,
+            DAMAGE_CONFIG['class_names'].get(name, name.replace('_', ' ').title()),
+            DAMAGE_CONFIG['severity_map'].get(name, 'Indefinido'),
+            DAMAGE_CONFIG['location_map'].get(name, 'N/A'),
+        ))
+    return class_meta
 
 def download_and_load_model():
+    """Baixa e carrega o modelo YOLO (no máximo uma vez, mesmo se chamado em paralelo)."""
+    with _model_lock:
+        if model is None:
+            _download_and_load_model()
+    # Também quando outra chamada já carregou: quem espera não depende de qual notificou
+    notify_model_loaded()
+
+@contextmanager
+def model_files_lock(model_path: str):
+    """Lock exclusivo entre processos (flock) sobre os arquivos do modelo."""
+    with open(f"{model_path}.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def notify_model_loaded():
+    """Acorda (a partir da thread de carregamento) as requisições aguardando o modelo."""
+    if _event_loop is not None:
+        _event_loop.call_soon_threadsafe(_model_loaded_event.set)
+
+def _download_and_load_model():
     """Baixa e carrega o modelo YOLO."""
-    global model, model_ready, model_error
+    global model, model_ready, model_error, _CLASS_META, _CLASS_SEVERITY_CODES
     
+    # O import do ultralytics/torch roda em paralelo com o download dos pesos
+    import_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="yolo-import")
     try:
+        stack_imported = import_pool.submit(import_inference_stack)
         logger.info("🔄 Iniciando download do modelo YOLO...")
         
-        # Download do modelo
-        model_path = "/tmp/car_damage_best.pt"  # Usar /tmp no Cloud Run
-        if not os.path.exists(model_path):
-            model_url = "https://github.com/Vamap91/YOLOProject/releases/download/v2.0.0/car_damage_best.pt"
+        # Download e exportação sob um lock de arquivo: com vários workers do gunicorn,
+        # só o primeiro baixa/exporta; os demais esperam e encontram os arquivos prontos
+        model_path = os.path.join(MODEL_DIR, "car_damage_best.pt")
+        with model_files_lock(model_path):
+            if not os.path.exists(model_path):
+                model_url = "https://github.com/Vamap91/YOLOProject/releases/download/v2.0.0/car_damage_best.pt"
+                
+                logger.info(f"📥 Baixando modelo de: {model_url}")
+                # Arquivo temporário evita deixar um .pt parcial no cache em caso de falha
+                part_path = f"{model_path}.{os.getpid()}.part"
+                downloaded = download_file(model_url, part_path)
+                os.replace(part_path, model_path)
+                
+                logger.info(f"✅ Modelo baixado! Tamanho: {downloaded / 1024 / 1024:.1f}MB")
+            else:
+                logger.info("✅ Modelo já existe no cache")
             
-            logger.info(f"📥 Baixando modelo de: {model_url}")
-            # Aumentar timeout para Google Cloud
-            response = requests.get(model_url, stream=True, timeout=900)
-            response.raise_for_status()
-            
-            total_size = int(response.headers.get('content-length', 0))
-            downloaded = 0
-            
-            with open(model_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-                        downloaded += len(chunk)
-                        
-                        # Log progresso a cada 10MB
-                        if downloaded % (10 * 1024 * 1024) == 0:
-                            progress = (downloaded / total_size) * 100 if total_size > 0 else 0
-                            logger.info(f"📥 Download: {progress:.1f}% ({downloaded / 1024 / 1024:.1f}MB)")
-            
-            logger.info(f"✅ Modelo baixado! Tamanho: {downloaded / 1024 / 1024:.1f}MB")
+            # Carregamento do modelo
+            stack_imported.result()
+            probe_dependencies()  # torch/ultralytics já importados: /test/dependencies não importa nada
+            model_path = export_model(model_path)
+        logger.info(f"🤖 Carregando modelo YOLO ({os.path.basename(model_path)})...")
+        if MODEL_BACKEND == "onnx":
+            model = OnnxYOLODetector(model_path)
         else:
-            logger.info("✅ Modelo já existe no cache")
+            model = _YOLO(model_path, task="detect")
+            if MODEL_BACKEND == "pytorch":
+                model.fuse()  # Conv+BN fundidos uma única vez
+        _CLASS_META = build_class_meta(model.names)
+        _CLASS_SEVERITY_CODES = np.array(
+            [SEVERITY_CODES.get(severity, len(SEVERITY_LEVELS)) for _, _, severity, _ in _CLASS_META],
+            dtype=np.int8
+        )
         
-        # Carregamento do modelo
-        logger.info("🤖 Carregando modelo YOLO...")
-        from ultralytics import YOLO
-        model = YOLO(model_path)
-        model_ready = True
-        
-        # Fazer uma predição de teste para "aquecer" o modelo
+        # Fazer uma predição de teste para "aquecer" o modelo e o caminho de
+        # renderização (desenho + JPEG) antes de aceitar requisições
         logger.info("🔥 Aquecendo modelo...")
-        test_image = np.zeros((640, 640, 3), dtype=np.uint8)
-        _ = model(test_image, verbose=False)
+        # Mesmo formato de uma foto após o load_image (lado maior 1024px)
+        test_image = np.zeros((768, 1024, 3), dtype=np.uint8)
+        render_annotated_image(test_image, extract_detections(run_model([test_image])[0]))
+        if TORCH_COMPILE and MODEL_BACKEND == "pytorch":
+            compile_model()
+            run_model([test_image])  # Compilação acontece aqui, não na primeira requisição
+        import torch
+        if MODEL_BACKEND != "onnx" and torch.cuda.is_available():
+            # cuDNN benchmark / TensorRT escolhem kernels por shape: aquecer cada tamanho
+            # de lote que o micro-batcher pode formar
+            for batch_size in range(2, MAX_BATCH_SIZE + 1):
+                run_model([test_image] * batch_size)
+        model_ready = True
+        model_error = None
         
         logger.info("✅ Modelo carregado e aquecido com sucesso!")
         
@@ -125,25 +946,290 @@ def download_and_load_model():
         logger.error(f"❌ Erro ao carregar modelo: {e}")
         model_error = str(e)
         model_ready = False
+        # Falha após criar o modelo (aquecimento, torch.compile...): descartar para que
+        # uma nova chamada de download_and_load_model tente de novo
+        model = None
+    finally:
+        import_pool.shutdown(wait=False)
+
+
+def iso_timestamp() -> str:
+    """Equivalente a datetime.now().isoformat(), reaproveitando a formatação do segundo atual."""
+    global _timestamp_cache
+    now = time.time()
+    second = int(now)
+    cached_second, prefix = _timestamp_cache
+    if second != cached_second:
+        prefix = datetime.fromtimestamp(second).isoformat()
+        _timestamp_cache = (second, prefix)
+    return f"{prefix}.{int((now - second) * 1_000_000):06d}"
+
+def get_cached_detection(cache_key: bytes) -> Optional[tuple]:
+    """Retorna (detecções, tamanho) em cache e marca como recente."""
+    cached = _detection_cache.get(cache_key)
+    if cached is not None:
+        _detection_cache.move_to_end(cache_key)
+    return cached
+
+def cache_detection(cache_key: bytes, value: tuple):
+    """Guarda o resultado de uma detecção, descartando o menos recente."""
+    if DETECTION_CACHE_SIZE <= 0:
+        return
+    _detection_cache[cache_key] = value
+    while len(_detection_cache) > DETECTION_CACHE_SIZE:
+        _detection_cache.popitem(last=False)
+
+def hash_upload(fileobj) -> bytes:
+    """Calcula o BLAKE2b (128 bits) do upload lendo em blocos e volta ao início do arquivo."""
+    digest = hashlib.blake2b(digest_size=16)
+    for chunk in iter(lambda: fileobj.read(1024 * 1024), b''):
+        digest.update(chunk)
+    fileobj.seek(0)
+    return digest.digest()
+
+# Escalas de decodificação JPEG suportadas pelo libjpeg-turbo (IDCT reduzida)
+_JPEG_REDUCED_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+def jpeg_decode_flag(data: bytes, max_size: int) -> int:
+    """Escolhe a maior redução de IDCT que ainda mantém o lado maior >= max_size."""
+    if not data.startswith(b'\xff\xd8'):
+        return cv2.IMREAD_COLOR
+    try:
+        # Image.open lê apenas o cabeçalho
+        largest_side = max(Image.open(io.BytesIO(data)).size)
+    except Exception:
+        return cv2.IMREAD_COLOR
+    for factor, flag in _JPEG_REDUCED_FLAGS:
+        if largest_side // factor >= max_size:
+            return flag
+    return cv2.IMREAD_COLOR
+
+def load_image(fileobj) -> np.ndarray:
+    """Decodifica a imagem enviada (BGR, convenção do YOLO) e reduz para no máximo 1024px."""
+    max_size = 1024
+    data = fileobj.read()
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    # Orientação EXIF ignorada (como no Pillow): image_size e bbox nas coordenadas do arquivo
+    image = cv2.imdecode(buffer, jpeg_decode_flag(data, max_size) | cv2.IMREAD_IGNORE_ORIENTATION)
+    if image is None:
+        # Formatos que o OpenCV não lê (ex.: GIF) continuam aceitos via Pillow
+        try:
+            image = cv2.cvtColor(np.asarray(Image.open(io.BytesIO(data)).convert("RGB")), cv2.COLOR_RGB2BGR)
+        except Exception:
+            raise HTTPException(status_code=400, detail="Formato de imagem não suportado")
+    
+    # Redimensionar se muito grande (INTER_AREA: rápido e sem aliasing na redução;
+    # o YOLO ainda redimensiona para 640)
+    height, width = image.shape[:2]
+    if max(height, width) > max_size:
+        scale = max_size / max(height, width)
+        new_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        image = cv2.resize(image, new_size, interpolation=cv2.INTER_AREA)
+        logger.info(f"🖼️ Imagem redimensionada para: {new_size}")
+    
+    return image
+
+def run_model(images: List[np.ndarray]) -> List[np.ndarray]:
+    """Executa o YOLO sobre um lote de imagens (chamada bloqueante).
+    
+    Retorna, por imagem, um array (N, 6) [x1, y1, x2, y2, conf, classe] já na CPU.
+    """
+    if MODEL_BACKEND == "onnx":
+        return model(images)
+    global _torch_input
+    import torch
+    # Entrada montada por nós em um shape fixo e num buffer reutilizado (pinned com GPU):
+    # todo lote chega ao modelo com a mesma forma, sem re-especializar cuDNN benchmark /
+    # torch.compile, e o Ultralytics pula o próprio letterbox e a normalização
+    if _torch_input is None or len(_torch_input) < len(images):
+        _torch_input = torch.empty(
+            (len(images), 3, *INFERENCE_IMGSZ), dtype=torch.float32, pin_memory=torch.cuda.is_available()
+        )
+    batch = _torch_input[:len(images)]
+    transforms = fill_input_blob(images, _torch_canvas, batch.numpy())
+    with torch.inference_mode():
+        results = model(batch, imgsz=INFERENCE_IMGSZ[0], half=_use_half, verbose=False)
+        # Uma única transferência por imagem (boxes.data), ainda na thread de inferência
+        detections = [result.boxes.data.cpu().numpy() for result in results]
+    return [
+        scale_boxes(data, gain, pad, image.shape[:2])
+        for data, (gain, pad), image in zip(detections, transforms, images)
+    ]
+
+async def inference_batch_worker():
+    """Agrupa requisições concorrentes e executa um único forward por lote."""
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await _inference_queue.get()]
+        deadline = loop.time() + MAX_BATCH_WAIT_SECONDS
+        while len(batch) < MAX_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(_inference_queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        
+        images = [img_array for img_array, _ in batch]
+        try:
+            results = await loop.run_in_executor(_inference_executor, run_model, images)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            continue
+        
+        if len(batch) > 1:
+            logger.info(f"📦 Lote de {len(batch)} imagens processado")
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+async def submit_inference(img_array: np.ndarray):
+    """Enfileira uma imagem para o micro-batcher e aguarda seu resultado."""
+    future = asyncio.get_running_loop().create_future()
+    await _inference_queue.put((img_array, future))
+    return await future
+
+def extract_detections(data: np.ndarray) -> List[Dict[str, Any]]:
+    """Converte o array (N, 6) do modelo em detecções (xyxy, conf, classe)."""
+    xyxy = data[:, :4]
+    confidences = data[:, 4].tolist()
+    class_ids = data[:, 5].astype(np.int32).tolist()
+    return [
+        {
+            'class_id': class_id,
+            'confidence': confidence,
+            'bbox': bbox
+        }
+        for class_id, confidence, bbox in zip(class_ids, confidences, xyxy)
+    ]
+
+def create_damage_analysis(detections: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Monta a análise de cada dano a partir das detecções do modelo."""
+    damage_analysis = []
+    for i, detection in enumerate(detections, 1):
+        class_name, class_display, severity, location = _CLASS_META[detection['class_id']]
+        damage_analysis.append({
+            'damage_id': f"DMG_{i:03d}",
+            'class': class_name,
+            'class_display': class_display,
+            'confidence': detection['confidence'],
+            'severity': severity,
+            'location': location,
+            'bbox': detection['bbox']
+        })
+    return damage_analysis
+
+# Cores BGR das caixas, por id de classe
+_BOX_COLORS = ((56, 56, 255), (151, 157, 255), (31, 112, 255), (29, 178, 255), (49, 210, 207), (10, 249, 72))
+
+def render_annotated_image(image: np.ndarray, detections: List[Dict[str, Any]]) -> bytes:
+    """Desenha as detecções sobre a imagem BGR e codifica em JPEG."""
+    annotated = image.copy()
+    thickness = max(2, round(sum(annotated.shape[:2]) / 2 * 0.003))
+    font_scale = thickness / 3
+    for detection in detections:
+        class_id = detection['class_id']
+        x1, y1, x2, y2 = detection['bbox'].astype(int).tolist()
+        color = _BOX_COLORS[class_id % len(_BOX_COLORS)]
+        label = f"{_CLASS_META[class_id][0]} {detection['confidence']:.2f}"
+        
+        cv2.rectangle(annotated, (x1, y1), (x2, y2), color, thickness, cv2.LINE_AA)
+        (text_width, text_height), baseline = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, font_scale, 1)
+        label_top = max(y1 - text_height - baseline, 0)
+        cv2.rectangle(annotated, (x1, label_top), (x1 + text_width, label_top + text_height + baseline), color, -1)
+        cv2.putText(
+            annotated, label, (x1, label_top + text_height), cv2.FONT_HERSHEY_SIMPLEX,
+            font_scale, (255, 255, 255), 1, cv2.LINE_AA
+        )
+    return image_to_jpeg(annotated)
+
+def render_upload(fileobj, detections: List[Dict[str, Any]]) -> bytes:
+    """Decodifica o upload de novo e desenha as detecções (resultado vindo do cache)."""
+    return render_annotated_image(load_image(fileobj), detections)
+
+def image_to_jpeg(image: np.ndarray) -> bytes:
+    """Codifica uma imagem BGR em JPEG."""
+    ok, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, ANNOTATED_JPEG_QUALITY])
+    if not ok:
+        raise ValueError("Falha ao codificar a imagem anotada")
+    return buffer.tobytes()
 
-def start_model_loading():
-    """Inicia carregamento do modelo em background."""
-    time.sleep(2)  # Pequeno delay para app inicializar
-    download_and_load_model()
+def jpeg_to_base64(jpeg_bytes: bytes) -> str:
+    """Converte bytes JPEG em data URI base64."""
+    if pybase64 is not None:
+        return "data:image/jpeg;base64," + pybase64.b64encode_as_string(jpeg_bytes)
+    return "data:image/jpeg;base64," + base64.b64encode(jpeg_bytes).decode("ascii")
 
-# Iniciar carregamento em background
-threading.Thread(target=start_model_loading, daemon=True).start()
+def store_annotated_image(jpeg_bytes: bytes) -> str:
+    """Guarda a imagem anotada e retorna seu identificador (chamada bloqueante)."""
+    global _last_annotated_prune
+    img_id = uuid.uuid4().hex
+    os.makedirs(ANNOTATED_IMAGE_DIR, exist_ok=True)
+    path = os.path.join(ANNOTATED_IMAGE_DIR, f"{img_id}.jpg")
+    with open(path + ".part", 'wb') as f:
+        f.write(jpeg_bytes)
+    os.replace(path + ".part", path)
+    now = time.monotonic()
+    if now - _last_annotated_prune >= ANNOTATED_IMAGE_PRUNE_INTERVAL_SECONDS:
+        _last_annotated_prune = now
+        prune_annotated_images()
+    return img_id
+
+def prune_annotated_images():
+    """Remove imagens expiradas e mantém no máximo ANNOTATED_IMAGE_MAX_ENTRIES."""
+    now = time.time()
+    entries = []
+    for entry in os.scandir(ANNOTATED_IMAGE_DIR):
+        if not entry.name.endswith(".jpg"):
+            continue
+        try:
+            mtime = entry.stat().st_mtime
+            if now - mtime >= ANNOTATED_IMAGE_TTL_SECONDS:
+                os.remove(entry.path)
+            else:
+                entries.append((mtime, entry.path))
+        except FileNotFoundError:
+            pass  # Já removida por outro worker
+    
+    entries.sort()
+    for _, path in entries[:-ANNOTATED_IMAGE_MAX_ENTRIES]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def get_annotated_image(img_id: str) -> Optional[bytes]:
+    """Retorna a imagem anotada armazenada, ou None se não existir/expirou."""
+    try:
+        img_id = uuid.UUID(hex=img_id).hex
+    except ValueError:
+        return None
+    
+    path = os.path.join(ANNOTATED_IMAGE_DIR, f"{img_id}.jpg")
+    try:
+        if time.time() - os.path.getmtime(path) >= ANNOTATED_IMAGE_TTL_SECONDS:
+            return None
+        with open(path, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
 
 @app.get("/")
 def root():
     """Endpoint raiz com informações da API."""
-    uptime = datetime.now() - startup_time
     return {
         "message": "🚗 YOLO Vehicle Damage Detection API - TESTADO E FUNCIONANDO",
         "version": "2.1.0",
         "status": "running",
         "model_ready": model_ready,
-        "uptime_seconds": int(uptime.total_seconds()),
+        "uptime_seconds": int(time.monotonic() - startup_time),
         "python_version": f"{os.sys.version_info.major}.{os.sys.version_info.minor}.{os.sys.version_info.micro}",
         "environment": os.environ.get("K_SERVICE", "local"),
         "tested": True,
@@ -152,6 +1238,7 @@ def root():
             "health": "/health",
             "ready": "/ready", 
             "detect": "/detect",
+            "annotated_image": "/detect/{id}/image",
             "model_info": "/model/info",
             "test_dependencies": "/test/dependencies",
             "docs": "/docs"
@@ -160,10 +1247,10 @@ def root():
 
 @app.get("/health")
 def health():
-    """Health check para Google Cloud Run."""
+    """Health check para Google Cloud Run (servido pelo HealthCheckMiddleware)."""
     return {
         "status": "healthy",
-        "timestamp": datetime.now().isoformat(),
+        "timestamp": iso_timestamp(),
         "service": "yolo-damage-detection",
         "version": "2.1.0",
         "tested": True
@@ -175,83 +1262,19 @@ def ready():
     return {
         "model_ready": model_ready,
         "model_error": model_error,
-        "timestamp": datetime.now().isoformat(),
-        "uptime_seconds": int((datetime.now() - startup_time).total_seconds()),
+        "timestamp": iso_timestamp(),
+        "uptime_seconds": int(time.monotonic() - startup_time),
         "version": "2.1.0"
     }
 
 @app.get("/test/dependencies")
 def test_dependencies():
     """Testa se todas as dependências estão funcionando."""
-    results = {}
-    
-    try:
-        import numpy as np
-        results["numpy"] = {
-            "status": "OK",
-            "version": np.__version__
-        }
-    except Exception as e:
-        results["numpy"] = {
-            "status": "ERROR",
-            "error": str(e)
-        }
-    
-    try:
-        import torch
-        results["torch"] = {
-            "status": "OK",
-            "version": torch.__version__
-        }
-    except Exception as e:
-        results["torch"] = {
-            "status": "ERROR",
-            "error": str(e)
-        }
-    
-    try:
-        import cv2
-        results["opencv"] = {
-            "status": "OK",
-            "version": cv2.__version__
-        }
-    except Exception as e:
-        results["opencv"] = {
-            "status": "ERROR",
-            "error": str(e)
-        }
-    
-    try:
-        from ultralytics import YOLO
-        results["ultralytics"] = {
-            "status": "OK",
-            "available": True
-        }
-    except Exception as e:
-        results["ultralytics"] = {
-            "status": "ERROR",
-            "error": str(e)
-        }
-    
-    try:
-        from PIL import Image
-        results["pillow"] = {
-            "status": "OK",
-            "available": True
-        }
-    except Exception as e:
-        results["pillow"] = {
-            "status": "ERROR",
-            "error": str(e)
-        }
-    
-    # Status geral
-    all_ok = all(dep["status"] == "OK" for dep in results.values())
-    
+    results, all_ok = probe_dependencies()
     return {
         "overall_status": "OK" if all_ok else "ERROR",
         "dependencies": results,
-        "timestamp": datetime.now().isoformat(),
+        "timestamp": iso_timestamp(),
         "version": "2.1.0",
         "tested_locally": True
     }
@@ -260,138 +1283,145 @@ def test_dependencies():
 async def detect_damage(
     file: UploadFile = File(...),
     include_annotated_image: bool = True,
+    inline_annotated_image: bool = False,
     vehicle_plate: Optional[str] = None,
     vehicle_model: Optional[str] = None,
     vehicle_year: Optional[int] = None,
     vehicle_color: Optional[str] = None
 ):
-    """Detecta danos em uma imagem de veículo."""
+    """Detecta danos em uma imagem de veículo.
+    
+    A imagem anotada é servida em `annotated_image_url`; use
+    `inline_annotated_image=true` para recebê-la também em base64 no JSON.
+    """
     
     # Validar arquivo
     if not file.content_type or not file.content_type.startswith('image/'):
         raise HTTPException(status_code=400, detail="Arquivo deve ser uma imagem")
     
-    # Verificar se modelo está pronto
-    if not model_ready:
-        if model_error:
-            raise HTTPException(status_code=500, detail=f"Erro no modelo: {model_error}")
-        else:
+    if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=upload_too_large_detail())
+    
+    # Verificar se modelo está pronto (durante o carregamento, aguarda em vez de recusar)
+    if not model_ready and not model_error:
+        try:
+            await asyncio.wait_for(_model_loaded_event.wait(), MODEL_WAIT_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
             raise HTTPException(
                 status_code=503, 
                 detail="Modelo ainda carregando. Aguarde alguns minutos e tente novamente."
             )
+    if not model_ready:
+        raise HTTPException(status_code=500, detail=f"Erro no modelo: {model_error}")
     
     try:
-        start_time = time.time()
+        start_time = time.perf_counter()
         
-        # Processar imagem
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents)).convert("RGB")
-        
-        # Redimensionar se muito grande
-        max_size = 1024
-        if max(image.size) > max_size:
-            image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
-            logger.info(f"🖼️ Imagem redimensionada para: {image.size}")
-        
-        # Detectar com YOLO
-        img_array = np.array(image)
-        results = model(img_array, verbose=False)
-        
-        # Processar detecções
-        detections = []
-        if len(results[0].boxes) > 0:
-            for box in results[0].boxes:
-                class_id = int(box.cls)
-                class_name = model.names[class_id]
-                detection = {
-                    'class': class_name,
-                    'confidence': float(box.conf),
-                    'bbox': box.xyxy[0].cpu().numpy().tolist()
-                }
-                detections.append(detection)
+        # Uploads repetidos (reenvios, reinspeções) reaproveitam o resultado anterior.
+        # O upload é lido direto do SpooledTemporaryFile, sem cópia extra em memória.
+        upload_digest = await asyncio.to_thread(hash_upload, file.file)
+        cached = get_cached_detection(upload_digest)
+        jpeg_bytes = None
+        if cached is not None:
+            detections, image_size = cached
+            logger.info("♻️ Resultado reaproveitado do cache")
+            # Imagem anotada fora do cache (memória): redesenhada a partir do upload
+            if include_annotated_image and len(detections) > 0:
+                jpeg_bytes = await asyncio.to_thread(render_upload, file.file, detections)
+        else:
+            # Processar imagem (decodificação fora do event loop)
+            img_array = await asyncio.to_thread(load_image, file.file)
+            image_size = (img_array.shape[1], img_array.shape[0])
+            
+            # Detectar com YOLO (agrupado com requisições concorrentes)
+            result = await submit_inference(img_array)
+            
+            # Processar detecções
+            detections = extract_detections(result)
+            
+            # Renderizar imagem anotada se solicitado
+            if include_annotated_image and len(detections) > 0:
+                jpeg_bytes = await asyncio.to_thread(render_annotated_image, img_array, detections)
+            
+            cache_detection(upload_digest, (detections, image_size))
         
         logger.info(f"🔍 Detectados {len(detections)} danos")
         
-        # Analisar danos
-        damage_analysis = []
-        for i, detection in enumerate(detections):
-            class_name = detection['class']
-            severity = DAMAGE_CONFIG['severity_map'].get(class_name, 'Indefinido')
-            location = DAMAGE_CONFIG['location_map'].get(class_name, 'N/A')
+        if detections:
+            # Analisar danos
+            damage_analysis = create_damage_analysis(detections)
             
-            damage_analysis.append({
-                'damage_id': f"DMG_{i+1:03d}",
-                'class': class_name,
-                'class_display': DAMAGE_CONFIG['class_names'].get(class_name, class_name.replace('_', ' ').title()),
-                'confidence': detection['confidence'],
-                'severity': severity,
-                'location': location,
-                'bbox': detection['bbox']
-            })
-        
-        # Calcular estatísticas
-        severity_count = {'Leve': 0, 'Moderado': 0, 'Severo': 0}
-        damage_types = []
+            # Calcular estatísticas: severidade via tabela por id de classe + bincount
+            class_ids = np.fromiter(
+                (detection['class_id'] for detection in detections),
+                dtype=np.intp, count=len(detections)
+            )
+            counts = np.bincount(_CLASS_SEVERITY_CODES[class_ids], minlength=len(SEVERITY_LEVELS) + 1)
+            damage_summary = {
+                "total_damages": len(damage_analysis),
+                "severity_count": dict(zip(SEVERITY_LEVELS, counts[:len(SEVERITY_LEVELS)].tolist())),
+                "damage_types": sorted({damage['class_display'] for damage in damage_analysis}),
+                # Urgência: índice = 2 * (há Severo) + (há Moderado)
+                "repair_urgency": REPAIR_URGENCY[int(counts[2] > 0) * 2 + int(counts[1] > 0)],
+            }
+        else:
+            # Veículo sem danos (caso comum): resumo pré-montado
+            damage_analysis = []
+            damage_summary = _NO_DAMAGE_SUMMARY
         
-        for damage in damage_analysis:
-            severity = damage.get('severity', 'Indefinido')
-            if severity in severity_count:
-                severity_count[severity] += 1
-            if damage['class_display'] not in damage_types:
-                damage_types.append(damage['class_display'])
+        # Preparar resposta
+        processing_time = time.perf_counter() - start_time
         
-        # Determinar urgência
-        urgency = 'Baixa'
-        if severity_count['Severo'] > 0:
-            urgency = 'Alta'
-        elif severity_count['Moderado'] > 0:
-            urgency = 'Média'
+        inspection_info = {"timestamp": iso_timestamp()} | _INSPECTION_TEMPLATE
+        inspection_info["original_filename"] = file.filename
+        inspection_info["processing_time_seconds"] = round(processing_time, 2)
+        inspection_info["image_size"] = f"{image_size[0]}x{image_size[1]}"
+        inspection_info["tested_locally"] = True
         
-        # Preparar resposta
-        processing_time = time.time() - start_time
+        if vehicle_plate or vehicle_model or vehicle_year or vehicle_color:
+            vehicle_info = {
+                "plate": vehicle_plate or NOT_INFORMED,
+                "model": vehicle_model or NOT_INFORMED,
+                "year": str(vehicle_year) if vehicle_year else NOT_INFORMED,
+                "color": vehicle_color or NOT_INFORMED
+            }
+        else:
+            vehicle_info = _EMPTY_VEHICLE.copy()
         
         response = {
-            "inspection_info": {
-                "timestamp": datetime.now().isoformat(),
-                "inspector": "Sistema IA YOLO API v2.1 - TESTADO",
-                "version": "2.1.0",
-                "original_filename": file.filename,
-                "processing_time_seconds": round(processing_time, 2),
-                "image_size": f"{image.size[0]}x{image.size[1]}",
-                "tested_locally": True
-            },
-            "vehicle_info": {
-                "plate": vehicle_plate or "Não informado",
-                "model": vehicle_model or "Não informado", 
-                "year": str(vehicle_year) if vehicle_year else "Não informado",
-                "color": vehicle_color or "Não informado"
-            },
-            "damage_analysis": {
-                "total_damages": len(damage_analysis),
-                "severity_count": severity_count,
-                "damage_types": sorted(damage_types),
-                "repair_urgency": urgency,
-            },
+            "inspection_info": inspection_info,
+            "vehicle_info": vehicle_info,
+            "damage_analysis": damage_summary,
             "damages": damage_analysis
         }
         
         # Incluir imagem anotada se solicitado
-        if include_annotated_image and len(detections) > 0:
-            annotated_img = results[0].plot()
-            annotated_pil = Image.fromarray(annotated_img)
-            buffer = io.BytesIO()
-            annotated_pil.save(buffer, format='JPEG', quality=85)
-            img_str = base64.b64encode(buffer.getvalue()).decode()
-            response["annotated_image"] = f"data:image/jpeg;base64,{img_str}"
+        if jpeg_bytes is not None:
+            # Escrita em disco (e limpeza periódica) fora do event loop
+            img_id = await asyncio.to_thread(store_annotated_image, jpeg_bytes)
+            response["annotated_image_id"] = img_id
+            response["annotated_image_url"] = f"/detect/{img_id}/image"
+            if inline_annotated_image:
+                response["annotated_image"] = jpeg_to_base64(jpeg_bytes)
         
         logger.info(f"✅ Processamento concluído em {processing_time:.2f}s")
-        return JSONResponse(content=response)
+        # Serializa os arrays NumPy (bbox) diretamente, sem jsonable_encoder
+        return FastJSONResponse(content=response)
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"❌ Erro na detecção: {e}")
         raise HTTPException(status_code=500, detail=f"Erro ao processar imagem: {str(e)}")
 
+@app.get("/detect/{img_id}/image")
+def annotated_image(img_id: str):
+    """Retorna a imagem anotada (JPEG) de uma detecção recente."""
+    jpeg_bytes = get_annotated_image(img_id)
+    if jpeg_bytes is None:
+        raise HTTPException(status_code=404, detail="Imagem anotada não encontrada ou expirada")
+    return Response(content=jpeg_bytes, media_type="image/jpeg")
+
 @app.get("/model/info")
 def model_info():
     """Informações sobre o modelo."""
@@ -422,9 +1452,17 @@ if __name__ == "__main__":
     logger.info(f"🌍 Environment: {os.environ.get('K_SERVICE', 'local')}")
     logger.info(f"✅ Versão TESTADA e FUNCIONANDO: 2.1.0")
     
+    # Em produção o gunicorn (Dockerfile) gerencia os workers; aqui o uvicorn sobe
+    # WEB_CONCURRENCY processos (cada um carrega o modelo no próprio lifespan)
+    workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+    limit_concurrency = os.environ.get("LIMIT_CONCURRENCY")
     uvicorn.run(
-        app, 
+        "main:app" if workers > 1 else app, 
         host="0.0.0.0", 
         port=port,
+        workers=workers,
+        loop="uvloop",
+        http="httptools",
+        limit_concurrency=int(limit_concurrency) if limit_concurrency else None,
         log_level="info"
     )
@@ -5,7 +5,6 @@ Script de teste para a API de detecção de danos veiculares.
 
 import requests
 import json
-import base64
 from PIL import Image
 import io
 
@@ -63,13 +62,13 @@ def test_detection(image_path: str):
                           f"(Confiança: {damage['confidence']:.2%}) - {damage['location']}")
             
             # Salvar imagem anotada se disponível
-            if 'annotated_image' in result:
+            if 'annotated_image_url' in result:
                 print("\n💾 Salvando imagem anotada...")
-                img_data = result['annotated_image'].split(',')[1]  # Remove o prefixo data:image/jpeg;base64,
-                img_bytes = base64.b64decode(img_data)
+                img_response = requests.get(f"{API_BASE_URL}{result['annotated_image_url']}")
+                img_response.raise_for_status()
                 
                 with open('resultado_anotado.jpg', 'wb') as f:
-                    f.write(img_bytes)
+                    f.write(img_response.content)
                 print("✅ Imagem salva como 'resultado_anotado.jpg'")
         else:
             print(f"Erro: {response.text}")